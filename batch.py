@@ -0,0 +1,61 @@
+"""OpenAI Batch API helpers for offline, non-interactive workloads."""
+import asyncio
+import orjson
+from openai import AsyncOpenAI
+
+# Batches complete within the 24h window, usually much sooner
+POLL_INTERVAL = 30  # seconds
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_file(requests: dict[str, dict]) -> bytes:
+    """Serialize chat completion request bodies as Batch API JSONL keyed by custom_id."""
+    return b"".join([
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        }) + b"\n"
+        for custom_id, body in requests.items()
+    ])
+
+
+async def run_batch(
+    client: AsyncOpenAI,
+    requests: dict[str, dict],
+    poll_interval: float = POLL_INTERVAL
+) -> dict[str, str | None]:
+    """Submit chat completion requests through the Batch API and wait for the results.
+
+    Returns the assistant text for each custom_id, or None if that request failed.
+    """
+    batch_file = await client.files.create(
+        file=("batch.jsonl", build_batch_file(requests)),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+
+    while batch.status not in TERMINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    results: dict[str, str | None] = dict.fromkeys(requests)
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            item = orjson.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[item["custom_id"]] = (content or "").strip()
+    return results
@@ -1,10 +1,27 @@
 """LLM Handler using OpenAI or OpenRouter for customer support chatbot."""
 import os
-import json
+import math
+import asyncio
+import hashlib
+from collections import deque
+from itertools import islice
 from pathlib import Path
-from openai import AsyncOpenAI
+from typing import TYPE_CHECKING, Any, AsyncIterator
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+from openai import (
+    AsyncOpenAI, NOT_GIVEN, APIConnectionError, APIStatusError, InternalServerError, OpenAIError, RateLimitError
+)
 from dotenv import load_dotenv
+from pydantic import TypeAdapter, ValidationError
 from mcp_client import MCPClient
+from batch import run_batch
+
+if TYPE_CHECKING:
+    # Imported lazily in LLMHandler so SEMANTIC_CACHE_ENABLED=false does not need faiss/numpy
+    from semantic_cache import SemanticCache
 
 # Load environment variables from project root .env file
 ENV_FILE = Path(__file__).parent / ".env"
@@ -14,18 +31,83 @@ load_dotenv(ENV_FILE, override=True)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 AI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 USE_OPEN_ROUTER = os.getenv("USE_OPEN_ROUTER", "false").lower() == "true"
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("MAX_REQUESTS_PER_MINUTE", "500"))
+MAX_TOKENS_PER_MINUTE = int(os.getenv("MAX_TOKENS_PER_MINUTE", "200000"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Shared HTTP/2 transport sized for many concurrent completions (httpx defaults cap at 100)
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    http2=True
+)
 
 # Initialize async client
 if USE_OPEN_ROUTER:
     client = AsyncOpenAI(
         api_key=OPENAI_API_KEY,
-        base_url="https://openrouter.ai/api/v1"
+        base_url="https://openrouter.ai/api/v1",
+        http_client=http_client,
+        max_retries=2
     )
     # OpenRouter requires provider prefix for OpenAI models
     if not AI_MODEL.startswith("openai/"):
         AI_MODEL = f"openai/{AI_MODEL}"
 else:
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client, max_retries=2)
+
+# Client-side throttling so traffic spikes queue here instead of failing with 429s
+_RPM_LIMITER = AsyncLimiter(MAX_REQUESTS_PER_MINUTE, time_period=60)
+_TPM_LIMITER = AsyncLimiter(MAX_TOKENS_PER_MINUTE, time_period=60)
+RATE_LIMIT_RETRIES = 3
+MAX_RETRY_DELAY = 30.0  # seconds; caps the server's retry-after so a request can't hang for minutes
+CHARS_PER_TOKEN = 4  # rough prompt size estimate, no tokenizer needed
+# Errors the SDK would normally retry; here they are retried below instead
+_RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+# Completions retry only in create_completion so every attempt goes back through
+# the limiters; SDK retries on top of that would multiply requests per failure
+_completions_client = client.with_options(max_retries=0)
+# The semantic cache is optional, so a failing embedding should not hold up the reply
+_embeddings_client = client.with_options(max_retries=0, timeout=5.0)
+# Statuses meaning the provider does not offer embeddings to us at all. 400 is left out:
+# it is also returned for one bad input (e.g. over the model's token limit), and a single
+# user message must not turn the cache off for everyone
+EMBEDDINGS_UNSUPPORTED_STATUSES = {401, 403, 404}
+
+
+def _retry_delay(error: OpenAIError, attempt: int) -> float:
+    """Seconds to wait before retrying, preferring the server's retry-after header.
+    
+    Clamped to [0, MAX_RETRY_DELAY] so a bad header can't stall the request.
+    """
+    delay = float(2 ** attempt)
+    if isinstance(error, APIStatusError):
+        try:
+            retry_after = float(error.response.headers.get("retry-after", ""))
+            if math.isfinite(retry_after):
+                delay = retry_after
+        except ValueError:
+            pass
+    return min(max(delay, 0.0), MAX_RETRY_DELAY)
+
+
+async def create_completion(**kwargs):
+    """Call chat.completions.create within the RPM/TPM budget, backing off on 429s and 5xx."""
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in kwargs["messages"])
+    est_tokens = min(prompt_chars // CHARS_PER_TOKEN + 1, MAX_TOKENS_PER_MINUTE)
+    # Tokens are budgeted once per prompt: a rejected attempt consumed none, and charging
+    # every retry could wait out a whole minute of budget per attempt for large prompts
+    await _TPM_LIMITER.acquire(est_tokens)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await _RPM_LIMITER.acquire()
+        try:
+            return await _completions_client.chat.completions.create(**kwargs)
+        except _RETRYABLE_ERRORS as e:
+            if attempt == RATE_LIMIT_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(e, attempt))
 
 
 SYSTEM_PROMPT = """You are a helpful customer support assistant for TechStore, a company that sells computer products including:
@@ -46,137 +128,407 @@ If a customer wants to place an order, you'll need their customer ID and verific
 
 Always be professional and aim to resolve customer inquiries efficiently."""
 
+# Parses and validates tool call arguments (a JSON object) in one C-level pass
+_TOOL_ARGUMENTS_ADAPTER = TypeAdapter(dict[str, Any])
+
+# Exact-match cache for answers that did not need any tools
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 600  # seconds
+
+# Near-duplicate cache: cosine similarity over question embeddings
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_SIZE = 10_000
+
+# Per-conversation histories, dropped after an hour without activity
+DEFAULT_CONVERSATION = "default"
+CONVERSATIONS_SIZE = 1024
+CONVERSATION_TTL = 3600  # seconds
+
 
 class LLMHandler:
     """Handles LLM interactions with OpenAI or OpenRouter."""
     
     def __init__(self, mcp_client: MCPClient):
         self.mcp_client = mcp_client
-        self.conversation_history: list[dict] = []
-    
-    def _build_tools_description(self) -> str:
-        """Build a description of available tools for the LLM."""
-        tools = self.mcp_client.get_tools_for_llm()
-        tools_text = "\n\nAvailable tools:\n"
-        for tool in tools:
-            params = tool.get("parameters", {}).get("properties", {})
-            required = tool.get("parameters", {}).get("required", [])
-            param_str = ", ".join([
-                f"{k}: {v.get('type', 'any')}" + (" (required)" if k in required else " (optional)")
-                for k, v in params.items()
-            ])
-            tools_text += f"\n- {tool['name']}({param_str})\n  {tool['description'][:200]}...\n"
+        # conversation_id -> history, each bounded so long sessions don't grow memory;
+        # only the tail is sent to the LLM
+        self._conversations: TTLCache = TTLCache(maxsize=CONVERSATIONS_SIZE, ttl=CONVERSATION_TTL)
+        # OpenAI tool schemas, rebuilt only when the tool list changes
+        self._tools: list[dict] | None = None
+        self._tools_version = -1
+        # Keyed on (tools version, recent history, user message); tool turns are never cached
+        self._response_cache: TTLCache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        # Only a conversation's opening question is matched, since later turns depend on context
+        self._semantic_cache: "SemanticCache | None" = None
+        if SEMANTIC_CACHE_ENABLED:
+            from semantic_cache import SemanticCache
+            self._semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+        self._semantic_cache_version = mcp_client.tools_version
+    
+    def _get_tools(self) -> list[dict]:
+        """Return the memoized tool schemas for the OpenAI tools parameter.
         
-        tools_text += """
-To use a tool, respond with a JSON object in this exact format:
-{"tool": "tool_name", "arguments": {"param1": "value1"}}
-
-Only respond with the JSON when you need to use a tool. Otherwise, respond normally to the user."""
-        return tools_text
+        Sorted by name so the serialized tools are byte-identical across turns,
+        which keeps provider-side prompt caching hitting.
+        """
+        if self._tools is None or self._tools_version != self.mcp_client.tools_version:
+            self._tools = sorted(
+                self.mcp_client.get_tools_for_llm(),
+                key=lambda tool: tool["function"]["name"]
+            )
+            self._tools_version = self.mcp_client.tools_version
+        return self._tools
+    
+    def _history(self, conversation_id: str) -> deque[dict]:
+        """Return the history for a conversation, starting a new one if needed."""
+        history = self._conversations.get(conversation_id)
+        if history is None:
+            history = deque(maxlen=20)
+        # Re-inserting refreshes the TTL, so only idle conversations expire
+        self._conversations[conversation_id] = history
+        return history
+    
+    def _cache_key(self, history: deque[dict], user_message: str) -> bytes:
+        """Hash the inputs that determine a tool-free answer to user_message."""
+        recent = list(islice(history, max(0, len(history) - 6), None))
+        payload = orjson.dumps([self.mcp_client.tools_version, recent, user_message])
+        return hashlib.blake2b(payload, digest_size=16).digest()
+    
+    async def _embed(self, text: str) -> list[float] | None:
+        """Embed text for the semantic cache.
+        
+        Failures skip just this message; the cache is only disabled when the provider
+        rejects embeddings outright (401/403/404), e.g. on OpenRouter.
+        """
+        await _RPM_LIMITER.acquire()
+        try:
+            response = await _embeddings_client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except APIStatusError as e:
+            if e.status_code in EMBEDDINGS_UNSUPPORTED_STATUSES:
+                print(f"Semantic cache disabled, embedding failed: {e}")
+                self._semantic_cache = None
+            else:
+                print(f"Embedding skipped: {e}")
+            return None
+        except OpenAIError as e:
+            print(f"Embedding skipped: {e}")
+            return None
+        return response.data[0].embedding
     
-    async def process_message(self, user_message: str) -> str:
-        """Process a user message and return the response."""
-        # Build the full prompt
-        tools_desc = self._build_tools_description()
-        full_system = SYSTEM_PROMPT + tools_desc
+    async def _lookup_cache(
+        self, history: deque[dict], user_message: str
+    ) -> tuple[bytes, list[float] | None, str | None]:
+        """Check the exact and semantic caches.
+        
+        Returns (cache_key, embedding, cached_response); the key and embedding are
+        reused by _store_cache if the message has to go to the LLM.
+        """
+        cache_key = self._cache_key(history, user_message)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None or self._semantic_cache is None or history:
+            return cache_key, None, cached
         
+        if self._semantic_cache_version != self.mcp_client.tools_version:
+            self._semantic_cache.clear()
+            self._semantic_cache_version = self.mcp_client.tools_version
+        embedding = await self._embed(user_message)
+        if embedding is None or self._semantic_cache is None:
+            return cache_key, None, None
+        return cache_key, embedding, self._semantic_cache.lookup(embedding)
+    
+    def _store_cache(self, cache_key: bytes, embedding: list[float] | None, response: str):
+        """Cache a tool-free response in the exact and (if embedded) semantic caches."""
+        if not response:
+            return
+        self._response_cache[cache_key] = response
+        if embedding is not None and self._semantic_cache is not None:
+            self._semantic_cache.add(embedding, response)
+    
+    def _use_cached_response(self, history: deque[dict], user_message: str, response: str):
+        """Record a cache hit in the history as if the LLM had answered."""
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": response})
+    
+    def _build_messages(self, history: deque[dict], user_message: str) -> list[dict]:
+        """Record the user message and build the messages list for OpenAI."""
         # Add user message to history
-        self.conversation_history.append({"role": "user", "content": user_message})
+        history.append({"role": "user", "content": user_message})
         
-        # Build messages for OpenAI
-        messages = [{"role": "system", "content": full_system}]
+        # Build messages for OpenAI. The system prompt (and the tools parameter) must stay
+        # static and first: providers only cache an identical prompt prefix, so never
+        # interpolate per-turn data such as timestamps or customer IDs into it.
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        # CACHE_BREAKPOINT: everything below varies per turn
         # Keep last 10 messages for context
-        messages.extend(self.conversation_history[-10:])
+        messages.extend(islice(history, max(0, len(history) - 10), None))
+        return messages
+    
+    async def process_message(
+        self, user_message: str, conversation_id: str = DEFAULT_CONVERSATION
+    ) -> tuple[str, bool]:
+        """Process a user message and return (response, served_from_cache)."""
+        history = self._history(conversation_id)
+        cache_key, embedding, cached = await self._lookup_cache(history, user_message)
+        if cached is not None:
+            self._use_cached_response(history, user_message, cached)
+            return cached, True
+        
+        messages = self._build_messages(history, user_message)
+        
+        # Tool schemas go in the structured tools field rather than the prompt
+        tools = self._get_tools() or NOT_GIVEN
         
         # Get response from LLM
-        completion = await client.chat.completions.create(
+        completion = await create_completion(
             model=AI_MODEL,
             messages=messages,
+            tools=tools,
             temperature=0.7
         )
         
-        response_text = completion.choices[0].message.content.strip()
+        message = completion.choices[0].message
         
-        # Check if the response is a tool call
-        tool_result = await self._try_parse_tool_call(response_text)
-        if tool_result:
-            # Execute the tool and get the result
-            tool_name, arguments, result = tool_result
-            
-            # Ask LLM to formulate a response with the tool result
+        if message.tool_calls:
+            tool_calls = [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments
+                    }
+                }
+                for tool_call in message.tool_calls
+            ]
+            # Echo the assistant's tool calls, then answer each one with a tool message
             tool_response_messages = messages + [
-                {"role": "assistant", "content": response_text},
-                {"role": "user", "content": f"""The tool '{tool_name}' was called with arguments {json.dumps(arguments)} and returned:
-
-{result}
-
-Please provide a helpful response to the user based on this information. Be concise and friendly. Do not include any JSON in your response."""}
+                {"role": "assistant", "content": message.content, "tool_calls": tool_calls}
             ]
+            # Independent tool calls run concurrently over the shared MCP session
+            results = await asyncio.gather(*[
+                self._execute_tool_call(tool_call) for tool_call in tool_calls
+            ])
+            for tool_call, result in zip(tool_calls, results):
+                tool_response_messages.append({
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "content": result
+                })
+            
+            # Fixed-shape results can be rendered directly, skipping the second LLM call
+            templated = self._render_templates(tool_calls, results)
+            if templated is not None:
+                history.append({"role": "assistant", "content": templated})
+                return templated, False
             
-            followup = await client.chat.completions.create(
+            # Ask LLM to formulate a response with the tool results
+            followup = await create_completion(
                 model=AI_MODEL,
                 messages=tool_response_messages,
+                tools=tools,
+                tool_choice="none" if tools is not NOT_GIVEN else NOT_GIVEN,
                 temperature=0.7
             )
-            final_response = followup.choices[0].message.content.strip()
+            final_response = (followup.choices[0].message.content or "").strip()
+            
+            history.append({"role": "assistant", "content": final_response})
+            return final_response, False
+        
+        response_text = (message.content or "").strip()
+        history.append({"role": "assistant", "content": response_text})
+        self._store_cache(cache_key, embedding, response_text)
+        return response_text, False
+    
+    async def process_message_stream(
+        self, user_message: str, conversation_id: str = DEFAULT_CONVERSATION
+    ) -> AsyncIterator[tuple[str, str]]:
+        """Process a user message, yielding ("cache", "HIT"|"MISS"), ("delta", text) and ("tool", name) events.
+        
+        Tool calls are started as soon as their arguments have been fully streamed,
+        while the rest of the completion is still arriving.
+        """
+        history = self._history(conversation_id)
+        cache_key, embedding, cached = await self._lookup_cache(history, user_message)
+        # Stream counterpart of the X-Cache header on /chat
+        yield ("cache", "HIT" if cached is not None else "MISS")
+        if cached is not None:
+            self._use_cached_response(history, user_message, cached)
+            yield ("delta", cached)
+            return
+        
+        messages = self._build_messages(history, user_message)
+        tools = self._get_tools() or NOT_GIVEN
+        
+        stream = await create_completion(
+            model=AI_MODEL,
+            messages=messages,
+            tools=tools,
+            temperature=0.7,
+            stream=True
+        )
+        
+        # Streamed fragments are collected in lists and joined once, not concatenated per delta
+        content_parts: list[str] = []
+        tool_calls: list[dict] = []
+        argument_parts: list[list[str]] = []
+        tool_tasks: list[asyncio.Task] = []
+        
+        def start_last_tool_call() -> str:
+            """Finalize the most recent tool call's arguments and start running it."""
+            tool_call = tool_calls[-1]
+            tool_call["function"]["arguments"] = "".join(argument_parts[-1])
+            tool_tasks.append(asyncio.create_task(self._execute_tool_call(tool_call)))
+            return tool_call["function"]["name"]
+        
+        # Tool calls start before the stream ends, so make sure none outlive this
+        # generator if the client disconnects or the stream fails partway
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield ("delta", delta.content)
+                for tool_call_delta in delta.tool_calls or []:
+                    if tool_call_delta.index >= len(tool_calls):
+                        # A new tool call begins, so the previous one's arguments are complete
+                        if tool_calls:
+                            yield ("tool", start_last_tool_call())
+                        tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                        argument_parts.append([])
+                    tool_call = tool_calls[tool_call_delta.index]
+                    if tool_call_delta.id:
+                        tool_call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        if tool_call_delta.function.name:
+                            tool_call["function"]["name"] += tool_call_delta.function.name
+                        if tool_call_delta.function.arguments:
+                            argument_parts[tool_call_delta.index].append(tool_call_delta.function.arguments)
             
-            # Clean up any tool call JSON from the response
-            final_response = self._clean_response(final_response)
+            content = "".join(content_parts)
+            if not tool_calls:
+                content = content.strip()
+                history.append({"role": "assistant", "content": content})
+                self._store_cache(cache_key, embedding, content)
+                return
             
-            self.conversation_history.append({"role": "assistant", "content": final_response})
-            return final_response
+            yield ("tool", start_last_tool_call())
+            results = await asyncio.gather(*tool_tasks)
+        finally:
+            for task in tool_tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Mark any failure as retrieved so it isn't logged as unhandled
+                    task.exception()
+        
+        templated = self._render_templates(tool_calls, results)
+        if templated is not None:
+            history.append({"role": "assistant", "content": templated})
+            yield ("delta", templated)
+            return
+        
+        tool_response_messages = messages + [
+            {"role": "assistant", "content": content or None, "tool_calls": tool_calls}
+        ]
+        for tool_call, result in zip(tool_calls, results):
+            tool_response_messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": result
+            })
+        
+        followup = await create_completion(
+            model=AI_MODEL,
+            messages=tool_response_messages,
+            tools=tools,
+            tool_choice="none",
+            temperature=0.7,
+            stream=True
+        )
+        response_parts: list[str] = []
+        async for chunk in followup:
+            if chunk.choices and chunk.choices[0].delta.content:
+                response_parts.append(chunk.choices[0].delta.content)
+                yield ("delta", chunk.choices[0].delta.content)
         
-        # Clean up response
-        response_text = self._clean_response(response_text)
-        self.conversation_history.append({"role": "assistant", "content": response_text})
-        return response_text
+        final_response = "".join(response_parts).strip()
+        history.append({"role": "assistant", "content": final_response})
     
-    async def _try_parse_tool_call(self, text: str) -> tuple[str, dict, str] | None:
-        """Try to parse a tool call from the response text."""
-        # Look for JSON in the response
+    def _render_templates(self, tool_calls: list[dict], results: list[str]) -> str | None:
+        """Render tool results with their response templates.
+        
+        Returns None, meaning the LLM should phrase the answer, unless every tool
+        has a template and every result is a JSON object that fills it.
+        """
+        rendered = []
+        for tool_call, result in zip(tool_calls, results):
+            template = self.mcp_client.get_response_template(tool_call["function"]["name"])
+            if not template:
+                return None
+            try:
+                data = orjson.loads(result)
+                if not isinstance(data, dict):
+                    return None
+                rendered.append(template.format(**data))
+            except (orjson.JSONDecodeError, KeyError, IndexError, ValueError, AttributeError, TypeError):
+                return None
+        return "\n\n".join(rendered)
+    
+    async def _execute_tool_call(self, tool_call: dict) -> str:
+        """Run a single tool call from the LLM against the MCP server."""
+        tool_name = tool_call["function"]["name"]
         try:
-            # Try to find JSON object in the text
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                # Fix Python-style booleans/None to JSON-style
-                json_str = json_str.replace(': True', ': true')
-                json_str = json_str.replace(':True', ':true')
-                json_str = json_str.replace(': False', ': false')
-                json_str = json_str.replace(':False', ':false')
-                json_str = json_str.replace(': None', ': null')
-                json_str = json_str.replace(':None', ':null')
-                data = json.loads(json_str)
-                if "tool" in data and "arguments" in data:
-                    tool_name = data["tool"]
-                    arguments = data["arguments"]
-                    # Execute the tool
-                    result = await self.mcp_client.call_tool(tool_name, arguments)
-                    return (tool_name, arguments, result)
-        except (json.JSONDecodeError, KeyError) as e:
+            arguments = _TOOL_ARGUMENTS_ADAPTER.validate_json(tool_call["function"]["arguments"] or "{}")
+        except ValidationError as e:
             print(f"Tool call parse error: {e}")
-            pass
-        return None
+            return f"Error: invalid arguments for tool '{tool_name}'"
+        return await self.mcp_client.call_tool(tool_name, arguments)
     
-    def _clean_response(self, text: str) -> str:
-        """Remove any tool call JSON from the response."""
-        # If the response is just a JSON tool call, return empty
-        try:
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                data = json.loads(json_str)
-                if "tool" in data and "arguments" in data:
-                    # Remove the JSON part
-                    before = text[:start].strip()
-                    after = text[end:].strip()
-                    return (before + " " + after).strip() or "Let me look that up for you..."
-        except (json.JSONDecodeError, KeyError):
-            pass
-        return text
+    async def process_batch(self, messages: list[str], use_batch_api: bool = True) -> list[str | None]:
+        """Answer independent user messages for offline jobs such as evals or log replays.
+        
+        Each message is a single turn with the system prompt only: no conversation
+        history and no tools, since a batch cannot execute tool calls mid-request.
+        With use_batch_api the requests go through the OpenAI Batch API (half the cost,
+        up to 24h latency); otherwise they are sent concurrently as regular completions.
+        Either way, a request that fails comes back as None.
+        """
+        requests = {
+            f"request-{i}": {
+                "model": AI_MODEL,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": message}
+                ],
+                "temperature": 0.7
+            }
+            for i, message in enumerate(messages)
+        }
+        
+        if use_batch_api:
+            results = await run_batch(client, requests)
+        else:
+            # Like the Batch API, a failed request yields None instead of sinking the rest
+            completions = await asyncio.gather(*[
+                create_completion(**body) for body in requests.values()
+            ], return_exceptions=True)
+            results = {}
+            for custom_id, completion in zip(requests, completions):
+                if isinstance(completion, BaseException):
+                    print(f"Batch request {custom_id} failed: {completion}")
+                    results[custom_id] = None
+                else:
+                    results[custom_id] = (completion.choices[0].message.content or "").strip()
+        return [results[custom_id] for custom_id in requests]
     
-    def clear_history(self):
+    def clear_history(self, conversation_id: str = DEFAULT_CONVERSATION):
         """Clear the conversation history."""
-        self.conversation_history = []
+        self._conversations.pop(conversation_id, None)
+    
+    def clear_cache(self):
+        """Drop all cached responses."""
+        self._response_cache.clear()
+        if self._semantic_cache is not None:
+            self._semantic_cache.clear()
@@ -1,14 +1,17 @@
 """FastAPI Customer Support Chatbot with MCP integration."""
 import os
+import gzip
+import hashlib
 from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-from pydantic import BaseModel
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 from mcp_client import MCPClient
-from llm_handler import LLMHandler
+from llm_handler import DEFAULT_CONVERSATION, LLMHandler, client as openai_client
 
 # Load environment variables from project root .env file
 ENV_FILE = Path(__file__).parent / ".env"
@@ -44,31 +47,84 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     print("Shutting down...")
+    await mcp_client.aclose()
+    await openai_client.close()
 
 
 app = FastAPI(
     title="TechStore Customer Support",
     description="AI-powered customer support chatbot for computer products",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
 class ChatRequest(BaseModel):
     message: str
+    # Generated by the browser so each chat tab keeps its own history
+    conversation_id: str = Field(DEFAULT_CONVERSATION, max_length=64)
+
+
+class ClearRequest(BaseModel):
+    conversation_id: str = Field(DEFAULT_CONVERSATION, max_length=64)
 
 
 class ChatResponse(BaseModel):
     response: str
 
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    """Serve the chat UI."""
-    return HTML_TEMPLATE
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Return True if the Accept-Encoding header allows gzip (honouring q=0 and '*')."""
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *params = [part.strip() for part in coding.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weakly compare an If-None-Match header ('*' or a list of tags) against etag."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.get("/")
+async def root(request: Request):
+    """Serve the chat UI from the precomputed bytes."""
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        content, etag = HTML_GZIP, HTML_GZIP_ETAG
+    else:
+        content, etag = HTML_BYTES, HTML_ETAG
+    headers = {
+        "Cache-Control": "public, max-age=3600",
+        "ETag": etag,
+        "Vary": "Accept-Encoding"
+    }
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    if content is HTML_GZIP:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=content, media_type="text/html", headers=headers)
+
+
+@app.post("/chat", response_model=ChatResponse, response_class=ORJSONResponse)
+async def chat(request: ChatRequest, response: Response):
     """Process a chat message and return the response."""
     if not llm_handler:
         raise HTTPException(status_code=503, detail="Service not initialized")
@@ -77,22 +133,57 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
     try:
-        response = await llm_handler.process_message(request.message)
-        return ChatResponse(response=response)
+        reply, cache_hit = await llm_handler.process_message(request.message, request.conversation_id)
+        response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
+        return ChatResponse(response=reply)
     except Exception as e:
         print(f"Error processing message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Process a chat message and stream the response as server-sent events."""
+    if not llm_handler:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    async def event_stream():
+        try:
+            async for event, data in llm_handler.process_message_stream(request.message, request.conversation_id):
+                yield f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            yield f"event: error\ndata: {orjson.dumps(str(e)).decode()}\n\n"
+        yield "event: done\ndata: null\n\n"
+    
+    # Keep proxies in front of the app (e.g. HF Spaces) from caching or buffering the stream
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/clear")
-async def clear_history():
+async def clear_history(request: ClearRequest | None = None):
     """Clear the conversation history."""
     if llm_handler:
-        llm_handler.clear_history()
+        llm_handler.clear_history(request.conversation_id if request else DEFAULT_CONVERSATION)
     return {"status": "ok"}
 
 
-@app.get("/health")
+@app.post("/cache/clear")
+async def clear_cache():
+    """Drop all cached responses, e.g. after product or policy data changes."""
+    if llm_handler:
+        llm_handler.clear_cache()
+    return {"status": "ok"}
+
+
+@app.get("/health", response_class=ORJSONResponse)
 async def health():
     """Health check endpoint."""
     return {
@@ -361,83 +452,157 @@ HTML_TEMPLATE = """
         <button class="secondary" onclick="clearChat()">Clear</button>
     </div>
     
-    <script>
-        const chatContainer = document.getElementById('chat-container');
-        const messageInput = document.getElementById('message-input');
-        const sendBtn = document.getElementById('send-btn');
-        const typingIndicator = document.getElementById('typing-indicator');
-        
-        messageInput.addEventListener('keypress', (e) => {
-            if (e.key === 'Enter' && !e.shiftKey) {
-                e.preventDefault();
-                sendMessage();
-            }
+    <!-- Markdown formatter, run in a Web Worker so long replies don't block the UI thread -->
+    <script type="text/js-worker" id="format-worker">
+        // Regexes are compiled once when the worker starts, not per message
+        const RX_AMP = /&/g;
+        const RX_LT = /</g;
+        const RX_GT = />/g;
+        const RX_HEADER = /^(#{1,6})\\s+(.+)$/gm;
+        const RX_BOLD_STARS = /\\*\\*(.+?)\\*\\*/g;
+        const RX_BOLD_UNDERSCORES = /__(.+?)__/g;
+        const RX_CODE = /`([^`]+)`/g;
+        const RX_ORDER_ID = /([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/gi;
+        const RX_PRICE = /(\\$[\\d,]+\\.\\d{2})/g;
+        const RX_STATUS = /\\b(Fulfilled|Submitted|Pending|Cancelled|Canceled)\\b/gi;
+        const STATUS_CLASSES = Object.freeze({
+            fulfilled: 'fulfilled',
+            submitted: 'submitted',
+            pending: 'pending',
+            cancelled: 'cancelled',
+            canceled: 'cancelled'
         });
+        const RX_NUMBERED_ITEM = /^(\\d+)\\.\\s+(.+)$/gm;
+        const RX_LIST_RUN = /(<li>.*<\\/li>\\n?)+/g;
+        const RX_BLOCKS = /(<ul.*?<\\/ul>|<h[1-6]>.*?<\\/h[1-6]>)/gs;
+        const RX_PARAGRAPH_BREAK = /\\n\\n+/;
+        const RX_LINE_BREAK = /([^>])\\n([^<])/g;
         
         // Convert markdown-style text to HTML
         function formatMessage(text) {
             // Escape HTML first to prevent XSS
             let html = text
-                .replace(/&/g, '&amp;')
-                .replace(/</g, '&lt;')
-                .replace(/>/g, '&gt;');
+                .replace(RX_AMP, '&amp;')
+                .replace(RX_LT, '&lt;')
+                .replace(RX_GT, '&gt;');
             
             // Convert markdown to HTML
-            // Headers: # H1, ## H2, ### H3, etc.
-            html = html.replace(/^######\\s+(.+)$/gm, '<h6>$1</h6>');
-            html = html.replace(/^#####\\s+(.+)$/gm, '<h5>$1</h5>');
-            html = html.replace(/^####\\s+(.+)$/gm, '<h4>$1</h4>');
-            html = html.replace(/^###\\s+(.+)$/gm, '<h3>$1</h3>');
-            html = html.replace(/^##\\s+(.+)$/gm, '<h2>$1</h2>');
-            html = html.replace(/^#\\s+(.+)$/gm, '<h1>$1</h1>');
+            // Headers: # H1, ## H2, ### H3, etc. (one pass, level from the # count)
+            html = html.replace(RX_HEADER, (_, hashes, body) => `<h${hashes.length}>${body}</h${hashes.length}>`);
             
             // Bold: **text** or __text__
-            html = html.replace(/\\*\\*(.+?)\\*\\*/g, '<strong>$1</strong>');
-            html = html.replace(/__(.+?)__/g, '<strong>$1</strong>');
+            html = html.replace(RX_BOLD_STARS, '<strong>$1</strong>');
+            html = html.replace(RX_BOLD_UNDERSCORES, '<strong>$1</strong>');
             
             // Inline code: `code`
-            html = html.replace(/`([^`]+)`/g, '<code>$1</code>');
+            html = html.replace(RX_CODE, '<code>$1</code>');
             
             // Format order IDs (UUID pattern)
-            html = html.replace(/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/gi, 
-                '<span class="order-id">$1</span>');
+            html = html.replace(RX_ORDER_ID, '<span class="order-id">$1</span>');
             
             // Format prices ($X,XXX.XX)
-            html = html.replace(/(\\$[\\d,]+\\.\\d{2})/g, '<span class="price">$1</span>');
+            html = html.replace(RX_PRICE, '<span class="price">$1</span>');
             
-            // Format status words
-            html = html.replace(/\\b(Fulfilled)\\b/gi, '<span class="status fulfilled">$1</span>');
-            html = html.replace(/\\b(Submitted)\\b/gi, '<span class="status submitted">$1</span>');
-            html = html.replace(/\\b(Pending)\\b/gi, '<span class="status pending">$1</span>');
-            html = html.replace(/\\b(Cancelled|Canceled)\\b/gi, '<span class="status cancelled">$1</span>');
+            // Format status words (one pass, badge class looked up by word)
+            html = html.replace(RX_STATUS, (word) => `<span class="status ${STATUS_CLASSES[word.toLowerCase()]}">${word}</span>`);
             
             // Numbered lists: 1. item (use <ul> to avoid double numbering)
-            html = html.replace(/^(\\d+)\\.\\s+(.+)$/gm, '<li><strong>$1.</strong> $2</li>');
+            html = html.replace(RX_NUMBERED_ITEM, '<li><strong>$1.</strong> $2</li>');
             
             // Wrap consecutive <li> in <ul> (not <ol> to avoid auto-numbering)
-            html = html.replace(/(<li>.*<\\/li>\\n?)+/g, '<ul class="numbered-list">$&</ul>');
+            html = html.replace(RX_LIST_RUN, '<ul class="numbered-list">$&</ul>');
             
             // Convert line breaks to paragraphs (but not inside lists or headers)
-            const parts = html.split(/(<ul.*?<\\/ul>|<h[1-6]>.*?<\\/h[1-6]>)/gs);
+            const parts = html.split(RX_BLOCKS);
             html = parts.map(part => {
                 if (part.startsWith('<ul') || part.startsWith('<h')) return part;
                 // Convert double newlines to paragraph breaks
-                return part.split(/\\n\\n+/).map(p => p.trim()).filter(p => p).map(p => `<p>${p}</p>`).join('');
+                return part.split(RX_PARAGRAPH_BREAK).map(p => p.trim()).filter(p => p).map(p => `<p>${p}</p>`).join('');
             }).join('');
             
             // Convert remaining single newlines to <br> within paragraphs
-            html = html.replace(/([^>])\\n([^<])/g, '$1<br>$2');
+            html = html.replace(RX_LINE_BREAK, '$1<br>$2');
             
             return html;
         }
         
+        self.onmessage = (e) => {
+            self.postMessage({ id: e.data.id, html: formatMessage(e.data.text) });
+        };
+    </script>
+    
+    <script>
+        const chatContainer = document.getElementById('chat-container');
+        const messageInput = document.getElementById('message-input');
+        const sendBtn = document.getElementById('send-btn');
+        const typingIndicator = document.getElementById('typing-indicator');
+        
+        // Each page load (and each Clear) starts a separate server-side conversation
+        function newConversationId() {
+            return Date.now().toString(36) + Math.random().toString(36).slice(2);
+        }
+        let conversationId = newConversationId();
+        
+        messageInput.addEventListener('keypress', (e) => {
+            if (e.key === 'Enter' && !e.shiftKey) {
+                e.preventDefault();
+                sendMessage();
+            }
+        });
+        
+        // Formatting runs in the worker; replies are matched to requests by id
+        const formatWorker = new Worker(URL.createObjectURL(new Blob(
+            [document.getElementById('format-worker').textContent],
+            { type: 'application/javascript' }
+        )));
+        const pendingFormats = new Map();
+        let nextFormatId = 0;
+        
+        formatWorker.onmessage = (e) => {
+            const resolve = pendingFormats.get(e.data.id);
+            pendingFormats.delete(e.data.id);
+            resolve(e.data.html);
+        };
+        
+        function formatMessage(text) {
+            return new Promise(resolve => {
+                const id = nextFormatId++;
+                pendingFormats.set(id, resolve);
+                formatWorker.postMessage({ id, text });
+            });
+        }
+        
+        // Per message: whether a format is in flight, and the latest text waiting for it
+        const renderStates = new WeakMap();
+        
+        // Render formatted text into an assistant message. Streaming calls this per token,
+        // so keep at most one format in flight and only format the newest text when it
+        // returns; intermediate texts are skipped instead of queueing up in the worker.
+        async function renderAssistant(div, text) {
+            let state = renderStates.get(div);
+            if (!state) {
+                state = { busy: false, pending: null };
+                renderStates.set(div, state);
+            }
+            state.pending = text;
+            if (state.busy) return;
+            state.busy = true;
+            while (state.pending !== null) {
+                const next = state.pending;
+                state.pending = null;
+                div.innerHTML = await formatMessage(next);
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+            state.busy = false;
+        }
+        
         function addMessage(content, role) {
             const div = document.createElement('div');
             div.className = 'message ' + role;
             
             if (role === 'assistant') {
                 // Format assistant messages with HTML
-                div.innerHTML = formatMessage(content);
+                renderAssistant(div, content);
             } else {
                 // Keep user messages as plain text
                 div.textContent = content;
@@ -445,6 +610,18 @@ HTML_TEMPLATE = """
             
             chatContainer.appendChild(div);
             chatContainer.scrollTop = chatContainer.scrollHeight;
+            return div;
+        }
+        
+        // Parse one server-sent event block into {type, data}
+        function parseEvent(raw) {
+            let type = 'message';
+            let data = '';
+            for (const line of raw.split('\\n')) {
+                if (line.startsWith('event: ')) type = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            return { type, data: data ? JSON.parse(data) : null };
         }
         
         async function sendMessage() {
@@ -457,30 +634,65 @@ HTML_TEMPLATE = """
             typingIndicator.classList.add('active');
             
             try {
-                const response = await fetch('/chat', {
+                const response = await fetch('/chat/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message })
+                    body: JSON.stringify({ message, conversation_id: conversationId })
                 });
                 
-                const data = await response.json();
-                
-                if (response.ok) {
-                    addMessage(data.response, 'assistant');
-                } else {
+                if (!response.ok) {
+                    const data = await response.json();
                     addMessage('Error: ' + (data.detail || 'Something went wrong'), 'system');
+                    return;
+                }
+                
+                // Render tokens into a live assistant message as they arrive
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let text = '';
+                let assistantDiv = null;
+                
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+                    
+                    for (const raw of events) {
+                        const event = parseEvent(raw);
+                        if (event.type === 'delta') {
+                            if (!assistantDiv) assistantDiv = addMessage('', 'assistant');
+                            typingIndicator.classList.remove('active');
+                            text += event.data;
+                            renderAssistant(assistantDiv, text);
+                        } else if (event.type === 'tool') {
+                            if (text) text += '\\n\\n';
+                            typingIndicator.textContent = 'Looking up information...';
+                            typingIndicator.classList.add('active');
+                        } else if (event.type === 'error') {
+                            addMessage('Error: ' + (event.data || 'Something went wrong'), 'system');
+                        }
+                    }
                 }
             } catch (err) {
                 addMessage('Error: Could not connect to server', 'system');
             } finally {
                 sendBtn.disabled = false;
                 typingIndicator.classList.remove('active');
+                typingIndicator.textContent = 'Assistant is typing...';
                 messageInput.focus();
             }
         }
         
         async function clearChat() {
-            await fetch('/clear', { method: 'POST' });
+            await fetch('/clear', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ conversation_id: conversationId })
+            });
+            conversationId = newConversationId();
             chatContainer.innerHTML = '<div class="message system">Chat cleared. How can I help you?</div>';
         }
     </script>
@@ -488,6 +700,15 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# Encode, compress and fingerprint the UI once at import time
+HTML_BYTES = HTML_TEMPLATE.encode("utf-8")
+# mtime=0 keeps the gzip header free of timestamps, so every worker and restart
+# produces identical bytes for the same strong ETag
+HTML_GZIP = gzip.compress(HTML_BYTES, 9, mtime=0)
+HTML_ETAG = '"' + hashlib.md5(HTML_BYTES).hexdigest() + '"'
+# Each encoding is a distinct representation, so it needs its own strong ETag
+HTML_GZIP_ETAG = '"' + hashlib.md5(HTML_BYTES).hexdigest() + '-gzip"'
+
 
 if __name__ == "__main__":
     import uvicorn
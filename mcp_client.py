@@ -1,5 +1,6 @@
 """MCP Client for connecting to the customer support MCP server."""
-import httpx
+import aiohttp
+import orjson
 from typing import Any
 
 
@@ -9,70 +10,93 @@ class MCPClient:
     def __init__(self, server_url: str):
         self.server_url = server_url
         self.tools: list[dict] = []
+        # Bumped whenever the tool list is (re)fetched so dependents can invalidate caches
+        self.tools_version = 0
+        # Shared session so repeated tool calls reuse pooled keep-alive connections.
+        # Created lazily because aiohttp sessions must be bound to the running loop.
+        self._session: aiohttp.ClientSession | None = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=100, ssl=False),
+                timeout=aiohttp.ClientTimeout(total=30),
+                json_serialize=lambda obj: orjson.dumps(obj).decode(),
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json"
+                }
+            )
+        return self._session
     
     async def initialize(self) -> None:
         """Fetch available tools from the MCP server."""
         self.tools = await self.list_tools()
+        self.tools_version += 1
+    
+    async def aclose(self) -> None:
+        """Close the underlying HTTP session."""
+        if self._session is not None:
+            await self._session.close()
     
     async def list_tools(self) -> list[dict]:
         """Get list of available tools from MCP server."""
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(
-                self.server_url,
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                },
-                json={
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "tools/list",
-                    "params": {}
-                },
-                timeout=30.0
-            )
-            result = response.json()
-            if "result" in result and "tools" in result["result"]:
-                return result["result"]["tools"]
-            return []
+        async with self._get_session().post(
+            self.server_url,
+            json={
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "tools/list",
+                "params": {}
+            }
+        ) as response:
+            result = await response.json(loads=orjson.loads, content_type=None)
+        if "result" in result and "tools" in result["result"]:
+            return result["result"]["tools"]
+        return []
     
     async def call_tool(self, tool_name: str, arguments: dict[str, Any]) -> str:
         """Call a tool on the MCP server."""
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(
-                self.server_url,
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                },
-                json={
-                    "jsonrpc": "2.0",
-                    "id": 2,
-                    "method": "tools/call",
-                    "params": {
-                        "name": tool_name,
-                        "arguments": arguments
-                    }
-                },
-                timeout=30.0
-            )
-            result = response.json()
-            if "result" in result:
-                content = result["result"].get("content", [])
-                if content and len(content) > 0:
-                    return content[0].get("text", str(result["result"]))
-            if "error" in result:
-                return f"Error: {result['error'].get('message', 'Unknown error')}"
-            return str(result)
+        async with self._get_session().post(
+            self.server_url,
+            json={
+                "jsonrpc": "2.0",
+                "id": 2,
+                "method": "tools/call",
+                "params": {
+                    "name": tool_name,
+                    "arguments": arguments
+                }
+            }
+        ) as response:
+            result = await response.json(loads=orjson.loads, content_type=None)
+        if "result" in result:
+            content = result["result"].get("content", [])
+            if content and len(content) > 0:
+                return content[0].get("text", str(result["result"]))
+        if "error" in result:
+            return f"Error: {result['error'].get('message', 'Unknown error')}"
+        return str(result)
+    
+    def get_response_template(self, tool_name: str) -> str | None:
+        """Return the tool's str.format template for rendering its JSON result, if the server provides one."""
+        for tool in self.tools:
+            if tool["name"] == tool_name:
+                return tool.get("responseTemplate") or (tool.get("_meta") or {}).get("responseTemplate")
+        return None
     
     def get_tools_for_llm(self) -> list[dict]:
-        """Convert MCP tools to a format suitable for LLM function calling."""
+        """Convert MCP tools to the OpenAI function calling tool schema."""
         llm_tools = []
         for tool in self.tools:
             llm_tools.append({
-                "name": tool["name"],
-                "description": tool["description"],
-                "parameters": tool.get("inputSchema", {"type": "object", "properties": {}})
+                "type": "function",
+                "function": {
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "parameters": tool.get("inputSchema", {"type": "object", "properties": {}})
+                }
             })
         return llm_tools
 
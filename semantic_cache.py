@@ -0,0 +1,55 @@
+"""Embedding-based cache for near-duplicate customer questions."""
+from collections import OrderedDict
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    """Maps question embeddings to answers, matched by cosine similarity with LRU eviction."""
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 10_000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # Created on first insert, once the embedding dimension is known
+        self._index: faiss.IndexIDMap | None = None
+        self._answers: OrderedDict[int, str] = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        """Return a unit-length float32 row so inner product equals cosine similarity."""
+        vector = np.asarray([embedding], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding: list[float]) -> str | None:
+        """Return the answer of the most similar cached question above the threshold."""
+        if self._index is None or not self._answers:
+            return None
+        scores, ids = self._index.search(self._normalize(embedding), 1)
+        entry_id = int(ids[0][0])
+        if entry_id == -1 or scores[0][0] <= self.threshold:
+            return None
+        self._answers.move_to_end(entry_id)
+        return self._answers[entry_id]
+
+    def add(self, embedding: list[float], answer: str):
+        """Cache an answer, evicting the least recently used entry when full."""
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(len(embedding)))
+        if len(self._answers) >= self.max_entries:
+            evicted_id, _ = self._answers.popitem(last=False)
+            self._index.remove_ids(np.asarray([evicted_id], dtype=np.int64))
+        entry_id = self._next_id
+        self._next_id += 1
+        self._index.add_with_ids(self._normalize(embedding), np.asarray([entry_id], dtype=np.int64))
+        self._answers[entry_id] = answer
+
+    def clear(self):
+        """Drop all cached entries."""
+        if self._index is not None:
+            self._index.reset()
+        self._answers.clear()
@@ -0,0 +1,5 @@
+"""Shared test setup."""
+import os
+
+# The OpenAI client is created at import time and refuses to start without a key
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
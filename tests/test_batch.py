@@ -0,0 +1,84 @@
+"""Tests for the Batch API helpers, using a fake OpenAI client."""
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from batch import build_batch_file, run_batch
+
+REQUESTS = {
+    "request-0": {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]},
+    "request-1": {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "bye"}]},
+    "request-2": {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "??"}]},
+}
+
+
+def output_line(custom_id: str, status_code: int, content: str | None = None) -> bytes:
+    body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+    return orjson.dumps({
+        "custom_id": custom_id,
+        "response": {"status_code": status_code, "body": body if status_code == 200 else {}}
+    })
+
+
+class FakeBatchClient:
+    """Records the uploaded file and replays a canned batch lifecycle."""
+
+    def __init__(self, statuses: list[str], output: bytes = b""):
+        self.statuses = statuses
+        self.output = output
+        self.uploaded: bytes | None = None
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _batch(self):
+        status = self.statuses.pop(0)
+        return SimpleNamespace(
+            id="batch-1", status=status, output_file_id="file-out" if status == "completed" else None
+        )
+
+    async def _create_file(self, file, purpose):
+        self.uploaded = file[1]
+        return SimpleNamespace(id="file-in")
+
+    async def _file_content(self, file_id):
+        return SimpleNamespace(content=self.output)
+
+    async def _create_batch(self, **kwargs):
+        return self._batch()
+
+    async def _retrieve_batch(self, batch_id):
+        return self._batch()
+
+
+def test_build_batch_file():
+    lines = build_batch_file(REQUESTS).splitlines()
+
+    assert [orjson.loads(line) for line in lines] == [
+        {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+        for custom_id, body in REQUESTS.items()
+    ]
+
+
+def test_run_batch_maps_output_by_custom_id():
+    # Output order differs from input order, and one request failed
+    output = b"\n".join([
+        output_line("request-2", 200, "  third  "),
+        output_line("request-1", 500),
+        b"",
+        output_line("request-0", 200, "first"),
+    ])
+    client = FakeBatchClient(["validating", "in_progress", "completed"], output)
+
+    results = asyncio.run(run_batch(client, REQUESTS, poll_interval=0))
+
+    assert client.uploaded == build_batch_file(REQUESTS)
+    assert results == {"request-0": "first", "request-1": None, "request-2": "third"}
+
+
+def test_run_batch_raises_when_batch_fails():
+    client = FakeBatchClient(["validating", "failed"])
+
+    with pytest.raises(RuntimeError, match="failed"):
+        asyncio.run(run_batch(client, REQUESTS, poll_interval=0))
@@ -0,0 +1,316 @@
+"""Tests for LLMHandler caching and streaming, with OpenAI and MCP replaced by fakes."""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from aiolimiter import AsyncLimiter
+
+import llm_handler
+from llm_handler import LLMHandler
+
+
+class FakeMCPClient:
+    """Just enough of MCPClient for LLMHandler."""
+
+    def __init__(self):
+        self.tools_version = 0
+        self.calls: list[tuple[str, dict]] = []
+
+    def get_tools_for_llm(self) -> list[dict]:
+        return []
+
+    def get_response_template(self, tool_name: str) -> str | None:
+        return None
+
+    async def call_tool(self, tool_name: str, arguments: dict) -> str:
+        self.calls.append((tool_name, arguments))
+        return f"{tool_name} result"
+
+
+def status_error(status_code: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(status_code, request=request)
+    return openai.APIStatusError(f"Error code: {status_code}", response=response, body=None)
+
+
+def fake_embeddings(monkeypatch, *outcomes):
+    """Make each embeddings.create call return or raise the next outcome."""
+    pending = list(outcomes)
+
+    async def create(**kwargs):
+        outcome = pending.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(data=[SimpleNamespace(embedding=outcome)])
+
+    monkeypatch.setattr(
+        llm_handler, "_embeddings_client", SimpleNamespace(embeddings=SimpleNamespace(create=create))
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    # Each test runs its own event loop, and a limiter must not be shared across loops
+    monkeypatch.setattr(llm_handler, "_RPM_LIMITER", AsyncLimiter(1000, time_period=60))
+    monkeypatch.setattr(llm_handler, "_TPM_LIMITER", AsyncLimiter(1_000_000, time_period=60))
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(llm_handler, "SEMANTIC_CACHE_ENABLED", True)
+    return LLMHandler(FakeMCPClient())
+
+
+@pytest.mark.parametrize("error", [
+    status_error(400),
+    status_error(500),
+    status_error(429),
+    openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/embeddings")),
+])
+def test_embedding_failure_skips_only_that_message(handler, monkeypatch, error):
+    fake_embeddings(monkeypatch, error, [1.0, 0.0])
+
+    async def run():
+        assert await handler._embed("x" * 100_000) is None
+        assert handler._semantic_cache is not None
+        assert await handler._embed("hello") == [1.0, 0.0]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 404])
+def test_embeddings_unsupported_disables_semantic_cache(handler, monkeypatch, status_code):
+    fake_embeddings(monkeypatch, status_error(status_code))
+
+    assert asyncio.run(handler._embed("hello")) is None
+    assert handler._semantic_cache is None
+
+
+def test_process_batch_without_batch_api_maps_failures_to_none(handler, monkeypatch):
+    async def create_completion(**kwargs):
+        content = kwargs["messages"][-1]["content"]
+        if content == "boom":
+            raise status_error(500)
+        message = SimpleNamespace(content=f" {content}! ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(llm_handler, "create_completion", create_completion)
+
+    results = asyncio.run(handler.process_batch(["hi", "boom", "bye"], use_batch_api=False))
+
+    assert results == ["hi!", None, "bye!"]
+
+
+def rate_limit_error(retry_after: str | None = None) -> openai.RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Error code: 429", response=response, body=None)
+
+
+@pytest.mark.parametrize("retry_after, attempt, expected", [
+    (None, 2, 4.0),
+    ("1.5", 0, 1.5),
+    ("3600", 0, llm_handler.MAX_RETRY_DELAY),
+    ("-5", 0, 0.0),
+    ("nan", 1, 2.0),
+    ("soon", 1, 2.0),
+])
+def test_retry_delay_is_clamped(retry_after, attempt, expected):
+    assert llm_handler._retry_delay(rate_limit_error(retry_after), attempt) == expected
+
+
+def test_create_completion_charges_tokens_once_across_retries(monkeypatch):
+    attempts = 0
+    token_charges: list[float] = []
+    sleeps: list[float] = []
+
+    async def create(**kwargs):
+        nonlocal attempts
+        attempts += 1
+        raise rate_limit_error("3600")
+
+    class CountingLimiter(AsyncLimiter):
+        async def acquire(self, amount: float = 1):
+            token_charges.append(amount)
+            await super().acquire(amount)
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(llm_handler, "_completions_client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    ))
+    monkeypatch.setattr(llm_handler, "_TPM_LIMITER", CountingLimiter(1_000_000, time_period=60))
+    monkeypatch.setattr(llm_handler.asyncio, "sleep", sleep)
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(llm_handler.create_completion(messages=[{"role": "user", "content": "x" * 400}]))
+
+    assert attempts == llm_handler.RATE_LIMIT_RETRIES + 1
+    assert token_charges == [101]
+    assert sleeps == [llm_handler.MAX_RETRY_DELAY] * llm_handler.RATE_LIMIT_RETRIES
+
+
+def chunk(content: str | None = None, *tool_calls: SimpleNamespace) -> SimpleNamespace:
+    delta = SimpleNamespace(content=content, tool_calls=list(tool_calls) or None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def tool_delta(index: int, arguments: str, id: str | None = None, name: str | None = None) -> SimpleNamespace:
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def fake_completions(monkeypatch, *streams):
+    """Make each streaming create_completion call iterate the next stream; returns the calls' kwargs."""
+    pending = list(streams)
+    calls: list[dict] = []
+
+    async def create_completion(**kwargs):
+        calls.append(kwargs)
+        return pending.pop(0)
+
+    monkeypatch.setattr(llm_handler, "create_completion", create_completion)
+    return calls
+
+
+async def stream_of(*chunks):
+    for item in chunks:
+        # Give tool tasks started by the previous chunk a chance to run
+        await asyncio.sleep(0)
+        yield item
+
+
+async def collect(handler: LLMHandler, message: str) -> list[tuple[str, str]]:
+    return [event async for event in handler.process_message_stream(message)]
+
+
+@pytest.fixture
+def stream_handler(monkeypatch):
+    monkeypatch.setattr(llm_handler, "SEMANTIC_CACHE_ENABLED", False)
+    return LLMHandler(FakeMCPClient())
+
+
+def test_stream_assembles_split_tool_calls(stream_handler, monkeypatch):
+    calls = fake_completions(
+        monkeypatch,
+        stream_of(
+            chunk(None, tool_delta(0, "", id="call_0", name="get_product")),
+            chunk(None, tool_delta(0, '{"sku": ')),
+            chunk(None, tool_delta(0, '"MON-1"}')),
+            chunk(None, tool_delta(1, '{"query"', id="call_1", name="search_products")),
+            chunk(None, tool_delta(1, ': "mouse"}')),
+        ),
+        stream_of(chunk("Here "), chunk("you go.")),
+    )
+    mcp_client = stream_handler.mcp_client
+
+    events = asyncio.run(collect(stream_handler, "compare"))
+
+    assert events == [
+        ("cache", "MISS"),
+        ("tool", "get_product"),
+        ("tool", "search_products"),
+        ("delta", "Here "),
+        ("delta", "you go."),
+    ]
+    assert mcp_client.calls == [("get_product", {"sku": "MON-1"}), ("search_products", {"query": "mouse"})]
+
+    followup_messages = calls[1]["messages"]
+    assert followup_messages[-3]["tool_calls"] == [
+        {"id": "call_0", "type": "function", "function": {"name": "get_product", "arguments": '{"sku": "MON-1"}'}},
+        {"id": "call_1", "type": "function",
+         "function": {"name": "search_products", "arguments": '{"query": "mouse"}'}},
+    ]
+    assert followup_messages[-2:] == [
+        {"role": "tool", "tool_call_id": "call_0", "content": "get_product result"},
+        {"role": "tool", "tool_call_id": "call_1", "content": "search_products result"},
+    ]
+    assert stream_handler._history("default")[-1] == {"role": "assistant", "content": "Here you go."}
+
+
+def test_stream_starts_tool_call_before_stream_ends(stream_handler, monkeypatch):
+    mcp_client = stream_handler.mcp_client
+    seen_before_end: list[tuple[str, dict]] = []
+
+    async def first_stream():
+        yield chunk(None, tool_delta(0, "{}", id="call_0", name="list_products"))
+        yield chunk(None, tool_delta(1, "{}", id="call_1", name="list_orders"))
+        await asyncio.sleep(0)
+        seen_before_end.extend(mcp_client.calls)
+
+    fake_completions(monkeypatch, first_stream(), stream_of(chunk("ok")))
+
+    asyncio.run(collect(stream_handler, "hi"))
+
+    assert seen_before_end == [("list_products", {})]
+
+
+def test_stream_content_then_tool_call(stream_handler, monkeypatch):
+    calls = fake_completions(
+        monkeypatch,
+        stream_of(
+            chunk("Let me "),
+            chunk("check."),
+            chunk(None, tool_delta(0, '{"order_id": 7}', id="call_0", name="get_order")),
+        ),
+        stream_of(chunk("Shipped.")),
+    )
+
+    events = asyncio.run(collect(stream_handler, "where is my order"))
+
+    assert events == [
+        ("cache", "MISS"),
+        ("delta", "Let me "),
+        ("delta", "check."),
+        ("tool", "get_order"),
+        ("delta", "Shipped."),
+    ]
+    assert calls[1]["messages"][-2]["content"] == "Let me check."
+    assert calls[1]["tool_choice"] == "none"
+
+
+def test_stream_plain_answer_is_cached(stream_handler, monkeypatch):
+    fake_completions(monkeypatch, stream_of(chunk(" Hello"), chunk("! ")))
+
+    assert asyncio.run(collect(stream_handler, "hi")) == [("cache", "MISS"), ("delta", " Hello"), ("delta", "! ")]
+    stream_handler.clear_history()
+    assert asyncio.run(collect(stream_handler, "hi")) == [("cache", "HIT"), ("delta", "Hello!")]
+
+
+def test_stream_failure_cancels_started_tool_calls(stream_handler, monkeypatch):
+    started = asyncio.Event()
+    cancelled = False
+
+    async def call_tool(tool_name: str, arguments: dict) -> str:
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "unreachable"
+
+    monkeypatch.setattr(stream_handler.mcp_client, "call_tool", call_tool)
+
+    async def failing_stream():
+        yield chunk(None, tool_delta(0, "{}", id="call_0", name="list_products"))
+        # The next tool call starts the first one running
+        yield chunk(None, tool_delta(1, "{}", id="call_1", name="list_orders"))
+        await started.wait()
+        raise RuntimeError("stream dropped")
+
+    fake_completions(monkeypatch, failing_stream())
+
+    async def run():
+        with pytest.raises(RuntimeError, match="stream dropped"):
+            await collect(stream_handler, "hi")
+        # Let the cancellation be delivered, then check before asyncio.run cancels leftovers itself
+        await asyncio.sleep(0)
+        assert started.is_set()
+        assert cancelled
+
+    asyncio.run(run())
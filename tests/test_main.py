@@ -0,0 +1,69 @@
+"""Tests for the header handling behind the cached chat UI."""
+import gzip
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import _accepts_gzip, _etag_matches
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", False),
+    ("gzip", True),
+    ("GZIP", True),
+    ("deflate, gzip;q=0.5, br", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0", False),
+    ("gzip;q=bogus", False),
+    ("x-gzip", True),
+    ("*", True),
+    ("*;q=0", False),
+    ("br, *;q=0", False),
+    # An explicit gzip entry wins over the wildcard
+    ("gzip;q=0, *", False),
+    ("gzip, *;q=0", True),
+    ("deflate, br", False),
+    (" , gzip", True),
+])
+def test_accepts_gzip(header, expected):
+    assert _accepts_gzip(header) is expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", False),
+    (ETAG, True),
+    ("W/" + ETAG, True),
+    ("*", True),
+    ('"other"', False),
+    ('"other", ' + ETAG, True),
+    ('"other",W/' + ETAG, True),
+    ('"abc"', False),
+    ("abc123", False),
+])
+def test_etag_matches(header, expected):
+    assert _etag_matches(header, ETAG) is expected
+
+
+def test_gzip_representation():
+    assert main.HTML_GZIP_ETAG != main.HTML_ETAG
+    assert gzip.decompress(main.HTML_GZIP) == main.HTML_BYTES
+    # No timestamp in the header, so the bytes behind the strong ETag are reproducible
+    assert main.HTML_GZIP == gzip.compress(main.HTML_BYTES, 9, mtime=0)
+    assert main.HTML_GZIP[4:8] == b"\0\0\0\0"
+
+
+def test_chat_stream_disables_proxy_buffering(monkeypatch):
+    async def process_message_stream(message, conversation_id):
+        yield ("delta", "hi")
+
+    monkeypatch.setattr(main, "llm_handler", SimpleNamespace(process_message_stream=process_message_stream))
+
+    response = TestClient(main.app).post("/chat/stream", json={"message": "hello"})
+
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["x-accel-buffering"] == "no"
+    assert response.text == 'event: delta\ndata: "hi"\n\nevent: done\ndata: null\n\n'
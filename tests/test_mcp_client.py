@@ -0,0 +1,23 @@
+"""Tests for MCPClient helpers that don't need a server."""
+from mcp_client import MCPClient
+
+
+def client_with_tools(*tools: dict) -> MCPClient:
+    client = MCPClient("http://mcp.invalid/mcp")
+    client.tools = list(tools)
+    return client
+
+
+def test_get_response_template():
+    client = client_with_tools(
+        {"name": "top_level", "responseTemplate": "{a}"},
+        {"name": "in_meta", "_meta": {"responseTemplate": "{b}"}},
+        {"name": "null_meta", "_meta": None},
+        {"name": "plain"},
+    )
+
+    assert client.get_response_template("top_level") == "{a}"
+    assert client.get_response_template("in_meta") == "{b}"
+    assert client.get_response_template("null_meta") is None
+    assert client.get_response_template("plain") is None
+    assert client.get_response_template("missing") is None
@@ -0,0 +1,53 @@
+"""Tests for the embedding-based semantic cache."""
+import math
+
+from semantic_cache import SemanticCache
+
+
+def at_similarity(cosine: float) -> list[float]:
+    """Return a 2-d vector with the given cosine similarity to [1, 0]."""
+    return [cosine, math.sqrt(1 - cosine ** 2)]
+
+
+def test_hit_above_threshold():
+    cache = SemanticCache()
+    cache.add([1.0, 0.0], "answer")
+    assert cache.lookup(at_similarity(0.93)) == "answer"
+    # Vectors are normalized, so magnitude does not matter
+    assert cache.lookup([5.0, 0.0]) == "answer"
+
+
+def test_miss_at_or_below_threshold():
+    cache = SemanticCache()
+    cache.add([1.0, 0.0], "answer")
+    assert cache.lookup(at_similarity(0.92)) is None
+    assert cache.lookup(at_similarity(0.5)) is None
+
+
+def test_lookup_on_empty_cache():
+    assert SemanticCache().lookup([1.0, 0.0]) is None
+
+
+def test_evicts_least_recently_used_at_max_entries():
+    cache = SemanticCache(max_entries=2)
+    cache.add([1.0, 0.0, 0.0], "a")
+    cache.add([0.0, 1.0, 0.0], "b")
+    # Touch "a" so "b" becomes the least recently used entry
+    assert cache.lookup([1.0, 0.0, 0.0]) == "a"
+    cache.add([0.0, 0.0, 1.0], "c")
+
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0]) == "a"
+    assert cache.lookup([0.0, 0.0, 1.0]) == "c"
+
+
+def test_clear():
+    cache = SemanticCache()
+    cache.add([1.0, 0.0], "answer")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.lookup([1.0, 0.0]) is None
+    # Still usable after clearing
+    cache.add([0.0, 1.0], "other")
+    assert cache.lookup([0.0, 1.0]) == "other"